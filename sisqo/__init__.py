@@ -6,6 +6,13 @@
 #
 
 
-from sisqo.ssh import SSH, NotConnectedError, NotAuthenticatedError, AlreadyAuthenticatedError, BadAuthenticationError
-from sisqo.configuration import Configuration, Line
+from sisqo.ssh import SSH, detectPlatform, NotConnectedError, NotAuthenticatedError, AlreadyAuthenticatedError, BadAuthenticationError
+from sisqo.configuration import Configuration, Line, LazyLine, ConfigurationColumns, fleetToColumns
+from sisqo.transport import Transport, PtyTransport, SocketTransport, LoopbackTransport
+from sisqo.latency import LatencyProfile, LatencyStore
+from sisqo.template import Template, Table, TemplateError, compileTemplate
+from sisqo.index import ConfigurationIndex
+from sisqo.dispatch import Dispatcher
+from sisqo.recording import RecordingTransport, ReplayTransport, RecordingError, readRecording
+from sisqo.history import ConfigurationHistory, HistoryError
 
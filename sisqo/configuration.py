@@ -8,6 +8,8 @@
 
 import re
 
+from array import array
+
 
 class Line(object):
 
@@ -126,11 +128,77 @@ class Line(object):
         return result
 
 
+class LazyLine(Line):
+    """
+    A top-level line whose children are parsed from the original config text the first time they are accessed
+    """
+
+    def __init__(self, lineNumber, value, source, start, end):
+        """
+        :type lineNumber: int
+        :type value: str
+        :type source: str
+        :type start: int
+        :type end: int
+        """
+        super(LazyLine, self).__init__(lineNumber, '', value)
+
+        self._source = source
+        """:type: str|None"""
+        self._start = start
+        """:type: int"""
+        self._end = end
+        """:type: int"""
+
+    @property
+    def children(self):
+        """
+        :rtype: list[Line]
+        """
+        if self._source is not None:
+
+            self._materialize()
+
+        return self._children
+
+    @children.setter
+    def children(self, value):
+
+        self._children = value
+
+    @property
+    def materialized(self):
+        """
+        :rtype: bool
+        """
+        return self._source is None
+
+    def _materialize(self):
+
+        source, self._source = self._source, None
+
+        # split this stanza's slice of the original text by newlines, and remove empty or all-whitespace lines
+        config = re.split(r'\r?\n', source[self._start:self._end], flags=re.UNICODE)
+        config = [line for line in config if len(line.strip()) > 0]
+
+        # parse the stanza's body with this line already on the parser stack, so that its children attach to us
+        parser = Configuration(None)
+        parser._parserStack.append(self)
+
+        for i, line in enumerate(config[1:], start=1):
+
+            parser._parseLine(configLine=line, lineNumber=(self._lineNumber or 0) + i)
+
+
 class Configuration(object):
 
-    def __init__(self, configString):
+    _topLevelRegex = re.compile(r'^[^ \r\n][^\n]*', flags=re.MULTILINE | re.UNICODE)
+    _nonBlankRegex = re.compile(r'^[^\S\r\n]*\S', flags=re.MULTILINE | re.UNICODE)
+
+    def __init__(self, configString, lazy=False):
         """
         :type configString: str
+        :type lazy: bool
         """
         self._root = []
         self._parserStack = []
@@ -139,6 +207,10 @@ class Configuration(object):
 
         if configString is None: return
 
+        if lazy and self._scan(configString):
+
+            return
+
         self._parse(configString)
 
     def __iter__(self):
@@ -197,6 +269,44 @@ class Configuration(object):
 
         return result
 
+    def subset(self, *regexes):
+        """
+        Returns a configuration of only the top-level lines matching any of `regexes`, sharing their `Line` objects
+
+        :type regexes: str
+        :rtype: Configuration
+        """
+        return Configuration.fromLines([child for child in self._root if any(
+            re.match(regex, child.value, flags=re.IGNORECASE | re.UNICODE) for regex in regexes)])
+
+    @classmethod
+    def fromLines(cls, lines):
+        """
+        Builds a configuration whose top-level lines are `lines`
+
+        :type lines: list[Line]
+        :rtype: Configuration
+        """
+        result = cls(None)
+        result._root = list(lines)
+
+        return result
+
+    def toColumns(self, device=None, columns=None):
+        """
+        Flattens this configuration into array-backed columns in a single depth-first traversal, appending to
+        `columns` if given so that many devices can share one set of columns and one string table
+
+        :type device: str|None
+        :type columns: ConfigurationColumns|None
+        :rtype: ConfigurationColumns
+        """
+        columns = columns if columns is not None else ConfigurationColumns()
+
+        columns._append(device, self._root)
+
+        return columns
+
     def _parse(self, configString):
         """
         :type configString: str
@@ -222,6 +332,59 @@ class Configuration(object):
 
             self._parseLine(configLine=line, lineNumber=i)
 
+    def _scan(self, configString):
+        """
+        :type configString: str
+        :rtype: bool
+        """
+        # skip text until the first comment
+        start = re.search(r'^!', configString, flags=re.MULTILINE)
+        start = start.start() if start else 0
+
+        # the first remaining line must be top-level; anything else needs the full parser
+        first = self._nonBlankRegex.search(configString, start)
+
+        if first is None or configString[first.start()] == ' ':
+
+            return False
+
+        # record each unindented line as the boundary of a top-level stanza
+        boundaries = []
+
+        for match in self._topLevelRegex.finditer(configString, start):
+
+            if len(match.group(0).strip()) > 0:
+
+                boundaries.append(match.start())
+
+        boundaries.append(len(configString))
+
+        root = []
+        lineNumber = 0
+
+        for begin, end in zip(boundaries, boundaries[1:]):
+
+            newline = configString.find('\n', begin, end)
+            value = configString[begin:newline if newline >= 0 else end].strip()
+            lineCount = len(self._nonBlankRegex.findall(configString, begin, end))
+
+            if value.startswith('!'):
+
+                # a top-level comment with indented lines beneath it needs the full parser
+                if lineCount > 1:
+
+                    return False
+
+            else:
+
+                root.append(LazyLine(lineNumber=lineNumber, value=value, source=configString, start=begin, end=end))
+
+            lineNumber += lineCount
+
+        self._root = root
+
+        return True
+
     def _parseLine(self, configLine, lineNumber):
         """
         :type configLine: str
@@ -278,3 +441,117 @@ class Configuration(object):
         else:
 
             self._root.append(line)  # add this line as a root line
+
+
+class ConfigurationColumns(object):
+    """
+    Columns describing every line of one or more configurations; `value` indexes into `strings` and `deviceId` into
+    `devices`, a root line's `parentId` is -1, and so is a missing `lineNumber`
+    """
+
+    FIELDS = ('nodeId', 'parentId', 'depth', 'lineNumber', 'value', 'deviceId')
+
+    def __init__(self):
+
+        self.nodeId = array('l')
+        """:type: array.array"""
+        self.parentId = array('l')
+        """:type: array.array"""
+        self.depth = array('i')
+        """:type: array.array"""
+        self.lineNumber = array('l')
+        """:type: array.array"""
+        self.value = array('l')
+        """:type: array.array"""
+        self.deviceId = array('l')
+        """:type: array.array"""
+
+        self.strings = []
+        """:type: list[str]"""
+        self.devices = []
+        """:type: list[str|None]"""
+
+        self._stringIds = {}
+        """:type: dict[str, int]"""
+
+    def __len__(self):
+        """
+        :rtype: int
+        """
+        return len(self.nodeId)
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<ConfigurationColumns lines={} devices={} strings={}>'.format(len(self), len(self.devices),
+                                                                             len(self.strings))
+
+    def _append(self, device, root):
+        """
+        :type device: str|None
+        :type root: list[Line]
+        """
+        deviceId = len(self.devices)
+        self.devices.append(device)
+
+        nodeId, parentId, depth = self.nodeId.append, self.parentId.append, self.depth.append
+        lineNumber, value, devices = self.lineNumber.append, self.value.append, self.deviceId.append
+        strings, stringIds = self.strings, self._stringIds
+
+        # an explicit stack of (parent node id, depth, line) instead of recursion, to stay fast on deep and wide trees
+        stack = [(-1, 0, line) for line in reversed(root)]
+
+        while stack:
+
+            parent, lineDepth, line = stack.pop()
+
+            node = len(self.nodeId)
+
+            stringId = stringIds.get(line.value)
+
+            if stringId is None:
+
+                stringId = stringIds[line.value] = len(strings)
+                strings.append(line.value)
+
+            nodeId(node)
+            parentId(parent)
+            depth(lineDepth)
+            lineNumber(line.lineNumber if line.lineNumber is not None else -1)
+            value(stringId)
+            devices(deviceId)
+
+            stack.extend((node, lineDepth + 1, child) for child in reversed(line.children))
+
+    def toDict(self):
+        """
+        :rtype: dict[str, array.array]
+        """
+        return dict((name, getattr(self, name)) for name in ConfigurationColumns.FIELDS)
+
+    def toArrays(self):
+        """
+        Requires NumPy; each column is copied in bulk, since a view onto the underlying buffer would stop any further
+        configurations from being appended to these columns for as long as the view is alive
+
+        :rtype: dict[str, numpy.ndarray]
+        """
+        import numpy
+
+        return dict((name, numpy.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode).copy())
+                    for name in ConfigurationColumns.FIELDS)
+
+
+def fleetToColumns(configurations):
+    """
+    :type configurations: dict[str, Configuration]|collections.Iterable[(str, Configuration)]
+    :rtype: ConfigurationColumns
+    """
+    columns = ConfigurationColumns()
+
+    for device, configuration in (configurations.items() if isinstance(configurations, dict) else configurations):
+
+        configuration.toColumns(device=device, columns=columns)
+
+    return columns
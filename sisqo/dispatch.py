@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright © 2017 Alex Forster. All rights reserved.
+# This software is licensed under the 3-Clause ("New") BSD license.
+# See the LICENSE file for details.
+#
+
+
+import re
+import codecs
+import logging
+import threading
+
+from sisqo.latency import monotonic
+
+try:
+
+    from queue import Queue, Empty, Full
+
+except ImportError:  # Python 2
+
+    from Queue import Queue, Empty, Full
+
+
+class Dispatcher(object):
+    """
+    Delivers what an `SSH` session reads and writes to its `onRead`/`onWrite` handlers from a background thread, as
+    deltas rather than whole screens
+
+    With `deltas='bytes'` handlers receive each chunk as it arrived (decoded as UTF-8); with `deltas='lines'` they
+    receive only complete lines. When the handlers fall behind and the queue is full, `policy='block'` stalls the
+    session until there is room, while `policy='drop'` discards the event and counts it in `dropped`.
+    """
+
+    READ = 'read'
+    WRITE = 'write'
+
+    def __init__(self, maxsize=1024, policy='block', deltas='bytes', batchSize=64, logger=None):
+        """
+        :type maxsize: int
+        :type policy: str
+        :type deltas: str
+        :type batchSize: int
+        :type logger: logging.Logger|None
+        """
+
+        if policy not in ('block', 'drop'):
+
+            raise ValueError('policy must be "block" or "drop"')
+
+        if deltas not in ('bytes', 'lines'):
+
+            raise ValueError('deltas must be "bytes" or "lines"')
+
+        self._policy = policy
+        """:type: str"""
+        self._deltas = deltas
+        """:type: str"""
+        self._batchSize = batchSize
+        """:type: int"""
+        self._log = logger or logging.getLogger('sisqo')
+        """:type: logging.Logger"""
+
+        self._queue = Queue(maxsize=maxsize)
+        """:type: Queue"""
+        self._thread = None
+        """:type: threading.Thread|None"""
+        self._dropped = 0
+        """:type: int"""
+        self._discarding = False
+        """:type: bool"""
+
+        self._handlers = {Dispatcher.READ: [], Dispatcher.WRITE: []}
+        """:type: dict[str, list[(str) => None]]"""
+        self._decoders = {}
+        """:type: dict[str, codecs.IncrementalDecoder]"""
+        self._partial = {Dispatcher.READ: '', Dispatcher.WRITE: ''}
+        """:type: dict[str, str]"""
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<Dispatcher policy={} deltas={} dropped={}>'.format(self._policy, self._deltas, self._dropped)
+
+    @property
+    def dropped(self):
+        """
+        :rtype: int
+        """
+        return self._dropped
+
+    def start(self, readHandlers, writeHandlers):
+        """
+        :type readHandlers: list[(str) => None]
+        :type writeHandlers: list[(str) => None]
+        """
+        self._handlers = {Dispatcher.READ: readHandlers, Dispatcher.WRITE: writeHandlers}
+
+        self._thread = threading.Thread(target=self._run, name='sisqo-dispatch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def read(self, data):
+        """
+        :type data: bytes
+        """
+        self._put((Dispatcher.READ, data, False))
+
+    def write(self, data, mask=False):
+        """
+        :type data: str
+        :type mask: bool
+        """
+        self._put((Dispatcher.WRITE, data, mask))
+
+    def close(self, timeout=None):
+        """
+        Stops the background thread. With `policy='block'`, everything still queued is delivered first, for up to
+        `timeout` seconds; with `policy='drop'`, whatever is still queued is discarded. Either way, this waits at most
+        `timeout` seconds for a handler that is still running, after which the thread exits as soon as it returns.
+
+        :type timeout: float|None
+        """
+        if self._thread is None:
+
+            return
+
+        deadline = None if timeout is None else monotonic() + timeout
+
+        if self._policy == 'drop':
+
+            self._discarding = True
+
+            while True:
+
+                try:
+
+                    self._queue.get_nowait()
+
+                except Empty:
+
+                    break
+
+        try:
+
+            self._queue.put(None, timeout=None if deadline is None else max(0, deadline - monotonic()))
+
+        except Full:
+
+            self._discarding = True  # the handlers are too far behind to catch up in time
+
+        self._thread.join(None if deadline is None else max(0, deadline - monotonic()))
+
+        if self._thread.is_alive():
+
+            self._discarding = True
+
+        self._thread = None
+
+    def _put(self, event):
+        """
+        :type event: (str, bytes|str, bool)
+        """
+        if self._thread is None:
+
+            return
+
+        if self._policy == 'block':
+
+            self._queue.put(event)
+            return
+
+        try:
+
+            self._queue.put_nowait(event)
+
+        except Full:
+
+            self._dropped += 1
+
+    def _run(self):
+
+        running = True
+
+        while running and not self._discarding:
+
+            batch = [self._queue.get()]
+
+            # drain whatever else is already waiting, so handlers are called once per batch instead of once per chunk
+            while len(batch) < self._batchSize:
+
+                try:
+
+                    batch.append(self._queue.get_nowait())
+
+                except Empty:
+
+                    break
+
+            if None in batch:
+
+                running = False
+                batch = batch[:batch.index(None)]
+
+            kind, texts = None, []
+
+            for event in batch:
+
+                if event[0] != kind:
+
+                    self._deliver(kind, texts)
+                    kind, texts = event[0], []
+
+                texts.append(self._decode(*event))
+
+            self._deliver(kind, texts)
+
+        for kind, partial in self._partial.items():
+
+            if partial: self._deliver(kind, ['\n'])
+
+    def _decode(self, kind, data, mask):
+        """
+        :type kind: str
+        :type data: bytes|str
+        :type mask: bool
+        :rtype: str
+        """
+        if not isinstance(data, str):
+
+            if kind not in self._decoders:
+
+                self._decoders[kind] = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+            data = self._decoders[kind].decode(data)
+
+        if mask:
+
+            data = re.sub(r'[^\r\n]', '*', data)
+
+        return data
+
+    def _deliver(self, kind, texts):
+        """
+        :type kind: str|None
+        :type texts: list[str]
+        """
+        if kind is None or not texts or self._discarding:
+
+            return
+
+        text = ''.join(texts)
+
+        if self._deltas == 'lines':
+
+            text = (self._partial[kind] + text).replace('\r', '')
+            text, newline, self._partial[kind] = text.rpartition('\n')
+
+            if not newline:
+
+                return
+
+            text += newline
+
+        for fn in list(self._handlers[kind]):
+
+            try:
+
+                fn(text)
+
+            except Exception:
+
+                self._log.exception('{} handler failed'.format(kind))
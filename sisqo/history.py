@@ -0,0 +1,302 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright © 2017 Alex Forster. All rights reserved.
+# This software is licensed under the 3-Clause ("New") BSD license.
+# See the LICENSE file for details.
+#
+
+
+import re
+import json
+import time
+import hashlib
+import sqlite3
+
+from difflib import SequenceMatcher
+
+from sisqo.configuration import Configuration, Line
+
+
+class HistoryError(Exception): pass
+
+
+class ConfigurationHistory(object):
+    """
+    Versioned configuration snapshots per device, persisted in SQLite
+
+    Every `Line` subtree is stored once, keyed by a hash of its content, so unchanged stanzas are shared between
+    versions. Each version stores its list of top-level subtrees as a delta against the previous version, with a full
+    checkpoint every `checkpointInterval` versions to bound reconstruction. Separately, each line's hierarchical path
+    is recorded with the versions it appeared and disappeared in, so line history queries never touch the snapshots.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, value TEXT NOT NULL,
+                                          children TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS versions (device TEXT NOT NULL, version INTEGER NOT NULL, timestamp REAL NOT NULL,
+                                             checkpoint INTEGER NOT NULL, roots TEXT NOT NULL,
+                                             PRIMARY KEY (device, version));
+        CREATE TABLE IF NOT EXISTS lifetimes (device TEXT NOT NULL, path TEXT NOT NULL, value TEXT NOT NULL,
+                                              appeared INTEGER NOT NULL, disappeared INTEGER);
+        CREATE INDEX IF NOT EXISTS lifetimes_by_value ON lifetimes (device, value);
+        CREATE INDEX IF NOT EXISTS lifetimes_by_path ON lifetimes (device, path);
+        CREATE INDEX IF NOT EXISTS lifetimes_current ON lifetimes (device, disappeared);
+    '''
+
+    def __init__(self, path=':memory:', checkpointInterval=30):
+        """
+        :type path: str
+        :type checkpointInterval: int
+        """
+        self._path = path
+        """:type: str"""
+        self._checkpointInterval = checkpointInterval
+        """:type: int"""
+        self._db = sqlite3.connect(path)
+        """:type: sqlite3.Connection"""
+        self._nodes = {}
+        """:type: dict[int, (str, list[int])]"""
+
+        self._db.create_function('REGEXP', 2, lambda regex, value: re.match(
+            regex, value, flags=re.IGNORECASE | re.UNICODE) is not None)
+        self._db.executescript(ConfigurationHistory.SCHEMA)
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<ConfigurationHistory "{}">'.format(self._path)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.close()
+
+    def versions(self, device):
+        """
+        :type device: str
+        :rtype: list[(int, float)]
+        """
+        return self._db.execute('SELECT version, timestamp FROM versions WHERE device = ? ORDER BY version',
+                                (device,)).fetchall()
+
+    def add(self, device, configuration, timestamp=None):
+        """
+        Records `configuration` as the next version of `device` and returns its version number
+
+        :type device: str
+        :type configuration: sisqo.configuration.Configuration
+        :type timestamp: float|None
+        :rtype: int
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+
+        latest = self._db.execute('SELECT MAX(version) FROM versions WHERE device = ?', (device,)).fetchone()[0]
+        version = 0 if latest is None else latest + 1
+
+        with self._db:
+
+            paths = set()
+            roots = [self._store(line, (), paths) for line in configuration]
+
+            if version % self._checkpointInterval == 0:
+
+                checkpoint, encoded = True, json.dumps(roots)
+
+            else:
+
+                checkpoint, encoded = False, json.dumps(self._delta(self._roots(device, latest), roots))
+
+            self._db.execute('INSERT INTO versions (device, version, timestamp, checkpoint, roots) VALUES (?, ?, ?, ?, ?)',
+                             (device, version, timestamp, int(checkpoint), encoded))
+
+            # close the lifetimes of lines that are gone, and open lifetimes for lines that are new
+            current = dict(self._db.execute('SELECT path, rowid FROM lifetimes WHERE device = ? AND disappeared IS NULL',
+                                            (device,)))
+
+            self._db.executemany('UPDATE lifetimes SET disappeared = ? WHERE rowid = ?',
+                                 [(version, rowid) for path, rowid in current.items() if path not in paths])
+
+            self._db.executemany('INSERT INTO lifetimes (device, path, value, appeared) VALUES (?, ?, ?, ?)',
+                                 [(device, path, path.rsplit('\n', 1)[-1], version)
+                                  for path in paths if path not in current])
+
+        return version
+
+    def get(self, device, version=None):
+        """
+        Reconstructs a version of `device`'s configuration (the latest by default); line numbers are renumbered in
+        depth-first order, and indentation is normalized to two spaces per level
+
+        :type device: str
+        :type version: int|None
+        :rtype: sisqo.configuration.Configuration
+        """
+        if version is None:
+
+            version = self._db.execute('SELECT MAX(version) FROM versions WHERE device = ?', (device,)).fetchone()[0]
+
+            if version is None:
+
+                raise HistoryError('no versions of "{}"'.format(device))
+
+        roots = self._roots(device, version)
+
+        self._load(roots)
+
+        lines = []
+        stack = [(None, 0, node) for node in reversed(roots)]
+
+        while stack:
+
+            parent, depth, node = stack.pop()
+
+            value, children = self._nodes[node]
+
+            line = Line(lineNumber=len(lines) + 1, indent='  ' * depth, value=value)
+            line.parent = parent
+            lines.append(line)
+
+            if parent is not None:
+
+                parent.children.append(line)
+
+            stack.extend((line, depth + 1, child) for child in reversed(children))
+
+        return Configuration.fromLines([line for line in lines if line.parent is None])
+
+    def lineHistory(self, device, regex):
+        """
+        Returns the path of every line whose value matches `regex` (with `Configuration.findChildren` semantics) in
+        any version of `device`, with the version it appeared in and the version it disappeared in (None if it is
+        still present); a line that came and went repeatedly has one entry per appearance
+
+        :type device: str
+        :type regex: str
+        :rtype: list[(tuple[str], int, int|None)]
+        """
+        rows = self._db.execute('SELECT path, appeared, disappeared FROM lifetimes WHERE device = ? AND value REGEXP ? '
+                                'ORDER BY appeared, rowid', (device, regex))
+
+        return [(tuple(path.split('\n')), appeared, disappeared) for path, appeared, disappeared in rows]
+
+    def close(self):
+
+        if self._db is not None:
+
+            self._db.close()
+            self._db = None
+
+    def _store(self, line, path, paths):
+        """
+        Stores `line`'s subtree bottom-up, reusing identical subtrees that are already stored, and returns its node id
+
+        :type line: sisqo.configuration.Line
+        :type path: tuple[str]
+        :type paths: set[str]
+        :rtype: int
+        """
+        path = path + (line.value,)
+        paths.add('\n'.join(path))
+
+        children = [self._store(child, path, paths) for child in line.children]
+
+        digest = hashlib.sha1(json.dumps([line.value, children]).encode('utf-8')).hexdigest()
+
+        row = self._db.execute('SELECT id FROM nodes WHERE hash = ?', (digest,)).fetchone()
+
+        if row is not None:
+
+            return row[0]
+
+        return self._db.execute('INSERT INTO nodes (hash, value, children) VALUES (?, ?, ?)',
+                                (digest, line.value, json.dumps(children))).lastrowid
+
+    def _roots(self, device, version):
+        """
+        Replays deltas forward from the nearest checkpoint at or before `version`
+
+        :type device: str
+        :type version: int
+        :rtype: list[int]
+        """
+        rows = self._db.execute('SELECT version, checkpoint, roots FROM versions WHERE device = ? AND version <= ? AND '
+                                'version >= (SELECT MAX(version) FROM versions WHERE device = ? AND version <= ? AND '
+                                'checkpoint = 1) ORDER BY version', (device, version, device, version)).fetchall()
+
+        if not rows or rows[-1][0] != version:
+
+            raise HistoryError('no version {} of "{}"'.format(version, device))
+
+        roots = []
+
+        for _, checkpoint, encoded in rows:
+
+            if checkpoint:
+
+                roots = json.loads(encoded)
+                continue
+
+            result = []
+
+            for op in json.loads(encoded):
+
+                if isinstance(op, list): result.extend(roots[op[0]:op[1]])
+                else: result.extend(op['+'])
+
+            roots = result
+
+        return roots
+
+    def _delta(self, previous, current):
+        """
+        Encodes `current` as [start, end] ranges copied from `previous` and {"+": [...]} runs of new node ids
+
+        :type previous: list[int]
+        :type current: list[int]
+        :rtype: list[list[int]|dict[str, list[int]]]
+        """
+        result = []
+
+        for op, i1, i2, j1, j2 in SequenceMatcher(None, previous, current, autojunk=False).get_opcodes():
+
+            if op == 'equal':
+
+                result.append([i1, i2])
+
+            elif j2 > j1:
+
+                result.append({'+': current[j1:j2]})
+
+        return result
+
+    def _load(self, nodes):
+        """
+        Fetches the given nodes and all of their descendants into the node cache, one tree level per query
+
+        :type nodes: list[int]
+        """
+        pending = set(node for node in nodes if node not in self._nodes)
+
+        while pending:
+
+            found = []
+            pending = list(pending)
+
+            for i in range(0, len(pending), 500):
+
+                batch = pending[i:i + 500]
+
+                found.extend(self._db.execute('SELECT id, value, children FROM nodes WHERE id IN ({})'.format(
+                    ','.join('?' * len(batch))), batch))
+
+            pending = set()
+
+            for node, value, children in found:
+
+                children = json.loads(children)
+                self._nodes[node] = (value, children)
+                pending.update(child for child in children if child not in self._nodes)
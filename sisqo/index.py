@@ -0,0 +1,180 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright © 2017 Alex Forster. All rights reserved.
+# This software is licensed under the 3-Clause ("New") BSD license.
+# See the LICENSE file for details.
+#
+
+
+import hashlib
+import sqlite3
+
+
+class ConfigurationIndex(object):
+    """
+    An inverted index from the tokens of every `Line` value to the device and hierarchical path it was found at,
+    persisted in SQLite so that it can be updated one device at a time
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS devices (device TEXT PRIMARY KEY, digest TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS lines (device TEXT NOT NULL, line INTEGER NOT NULL, path TEXT NOT NULL,
+                                          PRIMARY KEY (device, line));
+        CREATE TABLE IF NOT EXISTS tokens (token TEXT NOT NULL, device TEXT NOT NULL, line INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS tokens_by_token ON tokens (token);
+        CREATE INDEX IF NOT EXISTS tokens_by_device ON tokens (device);
+    '''
+
+    def __init__(self, path=':memory:'):
+        """
+        :type path: str
+        """
+        self._path = path
+        """:type: str"""
+        self._db = sqlite3.connect(path)
+        """:type: sqlite3.Connection"""
+
+        self._db.executescript(ConfigurationIndex.SCHEMA)
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<ConfigurationIndex "{}" devices={}>'.format(self._path, len(self))
+
+    def __len__(self):
+        """
+        :rtype: int
+        """
+        return self._db.execute('SELECT COUNT(*) FROM devices').fetchone()[0]
+
+    def __contains__(self, deviceId):
+        """
+        :type deviceId: str
+        :rtype: bool
+        """
+        return self._db.execute('SELECT 1 FROM devices WHERE device = ?', (deviceId,)).fetchone() is not None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.close()
+
+    @property
+    def devices(self):
+        """
+        :rtype: list[str]
+        """
+        return [row[0] for row in self._db.execute('SELECT device FROM devices ORDER BY device')]
+
+    def add(self, deviceId, configuration):
+        """
+        Indexes `configuration` under `deviceId`, replacing anything previously indexed for that device; returns False
+        if the configuration is unchanged since it was last indexed
+
+        :type deviceId: str
+        :type configuration: sisqo.configuration.Configuration
+        :rtype: bool
+        """
+        digest = hashlib.sha1(str(configuration).encode('utf-8')).hexdigest()
+
+        existing = self._db.execute('SELECT digest FROM devices WHERE device = ?', (deviceId,)).fetchone()
+
+        if existing is not None and existing[0] == digest:
+
+            return False
+
+        lines = []
+        tokens = []
+
+        # walk the tree depth-first, carrying each line's ancestry along with it
+        stack = [((child.value,), child) for child in reversed(list(configuration))]
+
+        while stack:
+
+            path, line = stack.pop()
+
+            lineId = len(lines)
+            lines.append((deviceId, lineId, '\n'.join(path)))
+            tokens.extend((token, deviceId, lineId) for token in set(line.value.lower().split()))
+
+            stack.extend((path + (child.value,), child) for child in reversed(line.children))
+
+        with self._db:
+
+            self._remove(deviceId)
+
+            self._db.execute('INSERT INTO devices (device, digest) VALUES (?, ?)', (deviceId, digest))
+            self._db.executemany('INSERT INTO lines (device, line, path) VALUES (?, ?, ?)', lines)
+            self._db.executemany('INSERT INTO tokens (token, device, line) VALUES (?, ?, ?)', tokens)
+
+        return True
+
+    def remove(self, deviceId):
+        """
+        :type deviceId: str
+        """
+        with self._db:
+
+            self._remove(deviceId)
+
+    def _remove(self, deviceId):
+        """
+        :type deviceId: str
+        """
+        self._db.execute('DELETE FROM tokens WHERE device = ?', (deviceId,))
+        self._db.execute('DELETE FROM lines WHERE device = ?', (deviceId,))
+        self._db.execute('DELETE FROM devices WHERE device = ?', (deviceId,))
+
+    def find(self, query, prefix=False):
+        """
+        Returns the paths of every line containing all of the whitespace-separated tokens in `query`, grouped by
+        device; with `prefix`, the last token matches any token that starts with it
+
+        :type query: str
+        :type prefix: bool
+        :rtype: dict[str, list[tuple[str]]]
+        """
+        words = query.lower().split()
+
+        if not words:
+
+            return {}
+
+        clauses = []
+        params = []
+
+        for i, word in enumerate(words):
+
+            if prefix and i == len(words) - 1:
+
+                # a range scan over the token index; the upper bound is the prefix with its last character incremented
+                clauses.append('SELECT device, line FROM tokens WHERE token >= ? AND token < ?')
+                params.extend([word, word[:-1] + chr(ord(word[-1]) + 1)])
+
+            else:
+
+                clauses.append('SELECT device, line FROM tokens WHERE token = ?')
+                params.append(word)
+
+        rows = self._db.execute('SELECT lines.device, lines.path FROM lines '
+                                'JOIN ({}) AS matches ON lines.device = matches.device AND lines.line = matches.line '
+                                'ORDER BY lines.device, lines.line'.format(' INTERSECT '.join(clauses)), params)
+
+        result = {}
+
+        for deviceId, path in rows:
+
+            result.setdefault(deviceId, []).append(tuple(path.split('\n')))
+
+        return result
+
+    def close(self):
+
+        if self._db is not None:
+
+            self._db.close()
+            self._db = None
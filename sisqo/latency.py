@@ -0,0 +1,173 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright © 2017 Alex Forster. All rights reserved.
+# This software is licensed under the 3-Clause ("New") BSD license.
+# See the LICENSE file for details.
+#
+
+
+import json
+import sqlite3
+
+from collections import deque
+from contextlib import closing
+
+try:
+
+    from time import monotonic
+
+except ImportError:  # Python 2
+
+    from time import time as monotonic
+
+
+class LatencyProfile(object):
+    """
+    Learns how long a device takes to start responding and how long it pauses between chunks of output, and derives
+    the timeout to wait between chunks once output has started from the observed percentiles
+    """
+
+    def __init__(self, samples=256, percentile=0.99, factor=3.0, minimum=0.5, warmup=8):
+        """
+        :type samples: int
+        :type percentile: float
+        :type factor: float
+        :type minimum: float
+        :type warmup: int
+        """
+
+        self._percentile = percentile
+        """:type: float"""
+        self._factor = factor
+        """:type: float"""
+        self._minimum = minimum
+        """:type: float"""
+        self._warmup = warmup
+        """:type: int"""
+
+        self._responses = deque(maxlen=samples)
+        """:type: collections.deque[float]"""
+        self._gaps = deque(maxlen=samples)
+        """:type: collections.deque[float]"""
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<LatencyProfile responses={} gaps={}>'.format(len(self._responses), len(self._gaps))
+
+    def addResponse(self, seconds):
+        """
+        :type seconds: float
+        """
+        self._responses.append(seconds)
+
+    def addGap(self, seconds):
+        """
+        :type seconds: float
+        """
+        self._gaps.append(seconds)
+
+    def idleTimeout(self, ceiling):
+        """
+        :type ceiling: float
+        :rtype: float
+        """
+        # a pause mid-output is rarely longer than the device takes to start responding, so response samples count too
+        return self._timeout(list(self._gaps) + list(self._responses), ceiling)
+
+    def _timeout(self, samples, ceiling):
+        """
+        :type samples: collections.deque[float]|list[float]
+        :type ceiling: float
+        :rtype: float
+        """
+        if len(samples) < self._warmup:
+
+            return ceiling
+
+        ordered = sorted(samples)
+        observed = ordered[min(len(ordered) - 1, int(len(ordered) * self._percentile))]
+
+        return min(ceiling, max(self._minimum, observed * self._factor))
+
+    def toDict(self):
+        """
+        :rtype: dict[str, list[float]]
+        """
+        return {'responses': list(self._responses), 'gaps': list(self._gaps)}
+
+    def update(self, values):
+        """
+        :type values: dict[str, list[float]]
+        """
+        self._responses.extend(values.get('responses', []))
+        self._gaps.extend(values.get('gaps', []))
+
+
+class LatencyStore(object):
+    """
+    Persists `LatencyProfile` samples per host in SQLite, so that later sessions start out already adapted; each host
+    is its own row, so sessions in other threads or processes can save concurrently without overwriting one another
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS profiles (host TEXT PRIMARY KEY, samples TEXT NOT NULL);
+    '''
+
+    def __init__(self, path, timeout=30):
+        """
+        :type path: str
+        :type timeout: float
+        """
+
+        self._path = path
+        """:type: str"""
+        self._timeout = timeout
+        """:type: float"""
+
+        with closing(self._connect()) as db:
+
+            db.executescript(LatencyStore.SCHEMA)
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<LatencyStore "{}">'.format(self._path)
+
+    def _connect(self):
+        """
+        A connection per operation, since sessions may load and save from any thread
+
+        :rtype: sqlite3.Connection
+        """
+        return sqlite3.connect(self._path, timeout=self._timeout)
+
+    def load(self, host, profile=None):
+        """
+        :type host: str
+        :type profile: LatencyProfile|None
+        :rtype: LatencyProfile
+        """
+        profile = profile or LatencyProfile()
+
+        with closing(self._connect()) as db:
+
+            row = db.execute('SELECT samples FROM profiles WHERE host = ?', (host,)).fetchone()
+
+        if row is not None:
+
+            profile.update(json.loads(row[0]))
+
+        return profile
+
+    def save(self, host, profile):
+        """
+        :type host: str
+        :type profile: LatencyProfile
+        """
+        with closing(self._connect()) as db, db:
+
+            db.execute('INSERT OR REPLACE INTO profiles (host, samples) VALUES (?, ?)',
+                       (host, json.dumps(profile.toDict())))
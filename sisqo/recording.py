@@ -0,0 +1,238 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright © 2017 Alex Forster. All rights reserved.
+# This software is licensed under the 3-Clause ("New") BSD license.
+# See the LICENSE file for details.
+#
+
+
+import re
+import time
+import struct
+
+from sisqo.latency import monotonic
+from sisqo.transport import Transport
+
+
+MAGIC = b'SISQOREC\x01'
+
+READ = b'r'
+WRITE = b'w'
+
+_header = struct.Struct('<cdI')  # kind, seconds since the recording started, payload length
+
+
+class RecordingError(Exception): pass
+
+
+def readRecording(path):
+    """
+    Yields the (kind, seconds, data) records of a session recording, where kind is `READ` or `WRITE`
+
+    :type path: str
+    :rtype: collections.Iterable[(bytes, float, bytes)]
+    """
+    with open(path, 'rb') as f:
+
+        if f.read(len(MAGIC)) != MAGIC:
+
+            raise RecordingError('{} is not a session recording'.format(path))
+
+        while True:
+
+            header = f.read(_header.size)
+
+            if len(header) < _header.size:
+
+                break  # a recording cut short mid-record simply ends at the last complete one
+
+            kind, seconds, length = _header.unpack(header)
+            data = f.read(length)
+
+            if len(data) < length:
+
+                break
+
+            yield kind, seconds, data
+
+
+class RecordingTransport(Transport):
+    """
+    Wraps another transport and appends everything read from and written to it to a recording file
+    """
+
+    def __init__(self, transport, path):
+        """
+        :type transport: sisqo.transport.Transport
+        :type path: str
+        """
+
+        self._transport = transport
+        """:type: sisqo.transport.Transport"""
+        self._path = path
+        """:type: str"""
+        self._file = open(path, 'wb')
+        """:type: file"""
+        self._started = monotonic()
+        """:type: float"""
+
+        self._file.write(MAGIC)
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<RecordingTransport "{}" {!r}>'.format(self._path, self._transport)
+
+    def _append(self, kind, data):
+        """
+        :type kind: bytes
+        :type data: bytes|bytearray
+        """
+        if self._file is None:
+
+            return
+
+        self._file.write(_header.pack(kind, monotonic() - self._started, len(data)))
+        self._file.write(data)
+
+    def write(self, data, mask=False):
+        """
+        :type data: bytes|bytearray
+        :type mask: bool
+        """
+        # secrets are recorded with the same length but every character other than line endings replaced
+        self._append(WRITE, re.sub(b'[^\r\n]', b'*', bytes(data)) if mask else data)
+        self._transport.write(data, mask=mask)
+
+    def read(self, nr=1024, timeout=0.1):
+        """
+        :type nr: int
+        :type timeout: float
+        :rtype: bytes|None
+        """
+        result = self._transport.read(nr, timeout=timeout)
+
+        if result is not None:
+
+            self._append(READ, result)
+
+        return result
+
+    def isalive(self):
+        """
+        :rtype: bool
+        """
+        return self._transport.isalive()
+
+    def close(self):
+
+        self._transport.close()
+
+        if self._file is not None:
+
+            self._file.close()
+            self._file = None
+
+
+class ReplayTransport(Transport):
+    """
+    Plays a session recording back into a session. Recorded reads are held back until the session has made as many
+    writes as preceded them in the recording, and are otherwise delivered at the original pace (scaled by `speed`) or,
+    with `speed=None`, as fast as the session consumes them.
+    """
+
+    def __init__(self, path, speed=None):
+        """
+        :type path: str
+        :type speed: float|None
+        """
+
+        self._path = path
+        """:type: str"""
+        self._speed = speed
+        """:type: float|None"""
+        self._records = list(readRecording(path))
+        """:type: list[(bytes, float, bytes)]"""
+        self._position = 0
+        """:type: int"""
+        self._offset = 0
+        """:type: int"""
+        self._writes = []
+        """:type: list[float]"""
+        self._replayed = 0
+        """:type: int"""
+        self._anchor = (monotonic(), 0.0)
+        """:type: (float, float)"""
+        self._closed = False
+        """:type: bool"""
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<ReplayTransport "{}" {}/{}>'.format(self._path, self._position, len(self._records))
+
+    def write(self, data, mask=False):
+        """
+        :type data: bytes|bytearray
+        :type mask: bool
+        """
+        self._writes.append(monotonic())
+
+    def read(self, nr=1024, timeout=0.1):
+        """
+        :type nr: int
+        :type timeout: float
+        :rtype: bytes|None
+        """
+        # pass over recorded writes that the session has already made, re-anchoring the clock at each one
+        while self._position < len(self._records) and self._records[self._position][0] == WRITE:
+
+            if self._replayed >= len(self._writes):
+
+                time.sleep(timeout)  # the session has not caught up with the recording; behave like an idle device
+                return None
+
+            self._anchor = (self._writes[self._replayed], self._records[self._position][1])
+            self._replayed += 1
+            self._position += 1
+
+        if self._position >= len(self._records):
+
+            raise EOFError('end of recording')
+
+        kind, seconds, data = self._records[self._position]
+
+        if self._speed is not None:
+
+            delay = self._anchor[0] + (seconds - self._anchor[1]) / self._speed - monotonic()
+
+            if delay > timeout:
+
+                time.sleep(timeout)
+                return None
+
+            if delay > 0:
+
+                time.sleep(delay)
+
+        result = data[self._offset:self._offset + nr]
+        self._offset += len(result)
+
+        if self._offset >= len(data):
+
+            self._position += 1
+            self._offset = 0
+
+        return result
+
+    def isalive(self):
+        """
+        :rtype: bool
+        """
+        return not self._closed
+
+    def close(self):
+
+        self._closed = True
@@ -6,19 +6,34 @@
 #
 
 
-import os
 import logging
 import traceback
 import re
 
-from datetime import datetime, timedelta
-from select import select
+try:
+
+    from re import _parser as sre_parse, _constants as sre_constants
+
+except ImportError:  # before Python 3.11
+
+    import sre_parse
+    import sre_constants
 
-from ptyprocess import PtyProcess
 from pyte.streams import ByteStream
 from pyte.screens import Screen
 
 from sisqo.configuration import Configuration
+from sisqo.latency import LatencyProfile, monotonic
+from sisqo.transport import PtyTransport
+from sisqo.recording import RecordingTransport
+
+try:
+
+    _stringTypes = basestring
+
+except NameError:  # Python 3
+
+    _stringTypes = str
 
 
 class NotConnectedError(Exception): pass
@@ -88,11 +103,131 @@ def onConnectionPrompt(prompt, state, logger):
     return None
 
 
+def detectPlatform(banner):
+    """
+    :type banner: str
+    :rtype: str
+    """
+
+    if re.search(r'^RP/\d+/[^:\s]+:\S+[>#]\s?$|IOS[ -]XR', banner, flags=re.MULTILINE):
+
+        return 'iosxr'
+
+    if re.search(r'NX-OS|Nexus', banner, flags=re.IGNORECASE):
+
+        return 'nxos'
+
+    if re.search(r'Adaptive Security Appliance|^Type help or \'\?\' for a list of available commands', banner,
+                 flags=re.IGNORECASE | re.MULTILINE):
+
+        return 'asa'
+
+    return 'ios'
+
+
+def _examples(regex, limit=64):
+    """
+    Returns a sample of the strings that `regex` matches at their start, covering each alternative, both ends of each
+    character class and repetition counts of at least the minimum and one more; raises ValueError on regex features
+    it cannot sample
+
+    :type regex: str
+    :type limit: int
+    :rtype: list[str]
+    """
+    c = sre_constants
+    pool = 'aZ09 -/._:'
+
+    def inClass(ch, items):
+
+        negate, found = False, False
+
+        for op, av in items:
+
+            if op == c.NEGATE: negate = True
+            elif op == c.LITERAL: found = found or ord(ch) == av
+            elif op == c.RANGE: found = found or av[0] <= ord(ch) <= av[1]
+            elif op == c.CATEGORY and av == c.CATEGORY_DIGIT: found = found or ch.isdigit()
+            elif op == c.CATEGORY and av == c.CATEGORY_SPACE: found = found or ch.isspace()
+            else: raise ValueError('cannot sample {}'.format(op))
+
+        return found != negate
+
+    def expand(pattern):
+
+        results = ['']
+
+        for op, av in pattern:
+
+            if op == c.AT:
+
+                continue
+
+            elif op == c.LITERAL:
+
+                options = [chr(av)]
+
+            elif op == c.NOT_LITERAL:
+
+                options = [ch for ch in pool if ord(ch) != av][:1]
+
+            elif op == c.ANY:
+
+                options = ['a', '/']
+
+            elif op == c.IN:
+
+                candidates = set(pool)
+                candidates.update(chr(av) for op, av in av if op == c.LITERAL)
+                candidates.update(chr(bound) for op, av in av if op == c.RANGE for bound in av)
+
+                options = sorted(ch for ch in candidates if inClass(ch, av))
+
+                options = options[:1] + options[-1:] if len(options) > 1 else options
+
+            elif op == c.BRANCH:
+
+                options = [example for branch in av[1] for example in expand(branch)]
+
+            elif op == c.SUBPATTERN:
+
+                options = expand(av[-1])
+
+            elif op in (c.MAX_REPEAT, c.MIN_REPEAT):
+
+                low, high, repeated = av
+                options = [example * count for count in sorted(set([low, min(low + 1, high)]))
+                           for example in expand(repeated)]
+
+            else:
+
+                raise ValueError('cannot sample {}'.format(op))
+
+            results = [prefix + option for prefix in results for option in options][:limit]
+
+        return results
+
+    return expand(sre_parse.parse(regex))
+
+
 class SSH(object):
 
     SCREEN_WIDTH = 512
     SCREEN_HEIGHT = 256
 
+    SECTION_PLATFORMS = ('ios', 'nxos')
+
+    PAGE_LENGTH = 24
+
+    DISPATCHER_CLOSE_TIMEOUT = 1.0
+
+    PAGER_COMMANDS = {
+        'ios': ['terminal length 0', 'terminal width 512'],
+        'iosxr': ['terminal length 0', 'terminal width 512'],
+        'nxos': ['terminal length 0', 'terminal width 511'],
+        'asa': ['terminal pager 0'],
+    }
+
     class LoggerAdapter(logging.LoggerAdapter):
 
         def __init__(self, prefix, logger):
@@ -104,7 +239,8 @@ class SSH(object):
 
             return '{}@{:x} - {}'.format(self.prefix, id(self), msg), kwargs
 
-    def __init__(self, host, port=22, username=None, timeout=10, sshOptions=None, logger=None):
+    def __init__(self, host, port=22, username=None, timeout=10, sshOptions=None, logger=None, transport=None,
+                 adaptiveTimeout=False, latencyStore=None, dispatcher=None, record=None):
         """
         :type host: str
         :type port: int
@@ -112,8 +248,17 @@ class SSH(object):
         :type timeout: int
         :type sshOptions: list|None
         :type logger: logging.Logger|None
+        :type transport: sisqo.transport.Transport|None
+        :type adaptiveTimeout: bool
+        :type latencyStore: sisqo.latency.LatencyStore|None
+        :type dispatcher: sisqo.dispatch.Dispatcher|None
+        :type record: str|None
         """
 
+        # assigned before anything that can raise, so that __del__ can always call disconnect()
+        self._transport = None
+        """:type: sisqo.transport.Transport|None"""
+
         self._host = host
         """:type: str"""
         self._port = port if isinstance(timeout, int) else 22
@@ -139,17 +284,56 @@ class SSH(object):
         self._readSinceWrite = False
         """:type: bool"""
 
+        self._banner = ''
+        """:type: str"""
+        self._refusedRegex = r'^\s*(%|ERROR:|\^)'
+        """:type: str"""
+        self._stats = {
+            'platform': None,
+            'pagerDisabled': False,
+            'paginationRounds': 0,
+            'paginationRoundsSaved': 0,
+        }
+        """:type: dict[str, object]"""
+
         self._readHandler = []
         self._writeHandler = []
 
-        args = ['ssh']
-        args.extend(self._sshOptions)
-        args.extend(['-oConnectTimeout={}'.format(self._timeout)] if isinstance(timeout, int) else [])
-        args.extend(['-p', self._port] if isinstance(self._port, int) and self._port != 22 else [])
-        args.extend([(username + '@' if username else '') + self._host])
+        # with a dispatcher, handlers are called from its background thread with deltas instead of inline
+        self._dispatcher = dispatcher
+        """:type: sisqo.dispatch.Dispatcher|None"""
+
+        self._latencyStore = latencyStore
+        """:type: sisqo.latency.LatencyStore|None"""
+        self._latency = None
+        """:type: sisqo.latency.LatencyProfile|None"""
 
-        self._pty = PtyProcess.spawn(args, dimensions=(SSH.SCREEN_HEIGHT, SSH.SCREEN_WIDTH), env={'TERM': 'vt100'})
-        """:type: ptyprocess.PtyProcess"""
+        if adaptiveTimeout or latencyStore is not None:
+
+            self._latency = LatencyProfile()
+
+        if transport is None:
+
+            transport = PtyTransport(self._host, port=self._port, username=self._username,
+                                     timeout=timeout if isinstance(timeout, int) else None,
+                                     sshOptions=self._sshOptions, dimensions=(SSH.SCREEN_HEIGHT, SSH.SCREEN_WIDTH))
+
+        try:
+
+            if latencyStore is not None:
+
+                latencyStore.load(self._host, self._latency)
+
+            if record is not None:
+
+                transport = RecordingTransport(transport, record)
+
+        except Exception:
+
+            transport.close()  # nothing else would close it, since the session never took ownership
+            raise
+
+        self._transport = transport
         self._vt = Screen(SSH.SCREEN_WIDTH, SSH.SCREEN_HEIGHT)
         """:type: pyte.Screen"""
         self._stream = ByteStream()
@@ -157,7 +341,12 @@ class SSH(object):
 
         self._stream.attach(self._vt)
 
-        self._log.debug('opened vty with `{}`'.format(' '.join(args)))
+        # only start the dispatcher's thread once there is a transport, so that disconnect() is sure to stop it
+        if dispatcher is not None:
+
+            dispatcher.start(self._readHandler, self._writeHandler)
+
+        self._log.debug('opened vty with {!r}'.format(self._transport))
 
     def __repr__(self):
         """
@@ -179,6 +368,29 @@ class SSH(object):
         """
         return self._port
 
+    @property
+    def stats(self):
+        """
+        `paginationRoundsSaved` is estimated from the length of each output, assuming `PAGE_LENGTH` lines per page
+
+        :rtype: dict[str, object]
+        """
+        return dict(self._stats)
+
+    @property
+    def platform(self):
+        """
+        :rtype: str|None
+        """
+        return self._stats['platform']
+
+    @property
+    def latency(self):
+        """
+        :rtype: sisqo.latency.LatencyProfile|None
+        """
+        return self._latency
+
     @property
     def promptRegex(self):
         """
@@ -217,18 +429,33 @@ class SSH(object):
 
     def disconnect(self):
 
-        if self._pty:
+        if self._transport:
 
-            self._pty.terminate(force=True)
+            self._transport.close()
 
             self._authenticated = False
 
-            self._pty = None
+            self._transport = None
             self._stream = None
             self._vt = None
 
             self._readSinceWrite = False
 
+            if self._dispatcher is not None:
+
+                # bounded, so that a stuck handler cannot hang disconnect() or __del__
+                self._dispatcher.close(timeout=SSH.DISPATCHER_CLOSE_TIMEOUT)
+
+            if self._latencyStore is not None:
+
+                try:
+
+                    self._latencyStore.save(self._host, self._latency)
+
+                except Exception as ex:
+
+                    self._log.warn(self._formatException(ex, 'could not save latency profile'))
+
             self._log.info('disconnected')
 
     def _read(self, timeout=None, stripPrompt=True, promptRegex=None):
@@ -245,7 +472,13 @@ class SSH(object):
 
             promptRegex = self.promptRegex
 
-        deadline = datetime.utcnow() + timedelta(seconds=timeout or self._timeout)
+        ceiling = timeout or self._timeout
+        started = monotonic()
+        lastReceived = None
+
+        # always wait up to the full timeout for the first byte; a learned timeout only shortens the wait between chunks
+        # once output has started, since cutting off a slow-to-start command would silently lose its output
+        deadline = started + ceiling
 
         eof = False
         self._vt.reset()
@@ -258,7 +491,25 @@ class SSH(object):
 
                 if read is not None:
 
-                    deadline = datetime.utcnow() + timedelta(seconds=timeout or self._timeout)
+                    now = monotonic()
+
+                    if self._latency is None:
+
+                        deadline = now + ceiling
+
+                    else:
+
+                        if lastReceived is None:
+
+                            self._latency.addResponse(now - started)
+
+                        else:
+
+                            self._latency.addGap(now - lastReceived)
+
+                        deadline = now + self._latency.idleTimeout(ceiling)
+
+                    lastReceived = now
 
                     self._stream.feed(read)
 
@@ -285,10 +536,12 @@ class SSH(object):
 
             if re.match(self._moreRegex, line, re.MULTILINE | re.IGNORECASE | re.UNICODE):
 
+                self._stats['paginationRounds'] += 1
+
                 self._send(' ')
                 continue
 
-            if datetime.utcnow() > deadline:
+            if monotonic() > deadline:
 
                 self._log.info('read timeout - could not match prompt regex or more pagination regex '
                                '(last regex match attempted against "{}")'
@@ -299,8 +552,14 @@ class SSH(object):
 
         vtlines = [l.rstrip() for l in self._vt.display[0:self._vt.cursor.y+1]]
 
-        for fn in self._readHandler:
-            fn('\n'.join(vtlines))
+        if self._dispatcher is None:
+
+            for fn in self._readHandler:
+                fn('\n'.join(vtlines))
+
+        if self._stats['pagerDisabled']:
+
+            self._stats['paginationRoundsSaved'] += len(vtlines) // (SSH.PAGE_LENGTH - 1)
 
         for line in vtlines:  # .rstrip() because unused vty cells are rendered as spaces
 
@@ -364,22 +623,22 @@ class SSH(object):
 
         readLen = len(command)
 
-        deadline = datetime.utcnow() + timedelta(seconds=timeout or self._timeout)
+        deadline = monotonic() + (timeout or self._timeout)
 
         while readLen > 0:
 
             recvd = self._recv(readLen)
 
-            if b'\r' in recvd:
-                recvd = recvd.replace(b'\r', b'')
-
             if recvd is not None:
 
-                deadline = datetime.utcnow() + timedelta(seconds=timeout or self._timeout)
+                if b'\r' in recvd:
+                    recvd = recvd.replace(b'\r', b'')
+
+                deadline = monotonic() + (timeout or self._timeout)
                 self._stream.feed(recvd)
                 readLen -= len(recvd)
 
-            elif datetime.utcnow() > deadline:
+            elif monotonic() > deadline:
 
                 break
 
@@ -394,12 +653,14 @@ class SSH(object):
 
         self._write(command, timeout=timeout or self._timeout, consumeEcho=consumeEcho)
 
-    def authenticate(self, password=None, passphrase=None, promptCallback=onConnectionPrompt, promptState=None):
+    def authenticate(self, password=None, passphrase=None, promptCallback=onConnectionPrompt, promptState=None,
+                     disablePaging=False):
         """
         :type password: str|None
         :type passphrase: str|None
         :type promptCallback: (str, dict[str, object], logging.Logger) => bool|None
         :type promptState: dict|None
+        :type disablePaging: bool
         :rtype: bool
         """
         try:
@@ -424,6 +685,8 @@ class SSH(object):
 
             prompt = self._read(promptRegex=r'.{5,}', stripPrompt=False)
 
+            self._banner += prompt + '\n'
+
             # if we appear to be authenticated...
             if re.findall(self._promptRegex, prompt, re.MULTILINE | re.IGNORECASE | re.UNICODE):
 
@@ -431,6 +694,10 @@ class SSH(object):
 
                 self._authenticated = True
 
+                if disablePaging:
+
+                    self.disablePaging()
+
                 break
 
             result = promptCallback(prompt, state, self._log)
@@ -443,9 +710,10 @@ class SSH(object):
 
         return self._authenticated
 
-    def enable(self, password):
+    def enable(self, password, disablePaging=False):
         """
         :type password: str
+        :type disablePaging: bool
         :rtype: bool
         """
 
@@ -458,6 +726,11 @@ class SSH(object):
         if 'password:' not in prompt.lower():
 
             self._log.warn('remote did not prompt for an enable password')
+
+            if disablePaging and not self._stats['pagerDisabled']:
+
+                self.disablePaging()
+
             return True
 
         self._write(password, consumeEcho=False, mask=True)
@@ -471,27 +744,197 @@ class SSH(object):
 
         self._log.info('enabled')
 
+        # some platforms (e.g. ASA) only accept pager commands once enabled
+        if disablePaging and not self._stats['pagerDisabled']:
+
+            self.disablePaging()
+
         return True
 
-    def showRunningConfig(self):
+    def disablePaging(self, platform=None):
         """
+        Detects the platform from the login banner and prompt (unless given one of `PAGER_COMMANDS`) and turns off
+        its "more" pagination; returns False if the device refuses, in which case pagination is handled as usual
+
+        :type platform: str|None
+        :rtype: bool
+        """
+
+        self._assertConnectionState(connected=True, authenticated=True)
+
+        if platform is not None and platform not in SSH.PAGER_COMMANDS:
+
+            raise ValueError('unknown platform "{}"; expected one of {}'.format(
+                platform, ', '.join(sorted(SSH.PAGER_COMMANDS))))
+
+        platform = platform or self._stats['platform'] or detectPlatform(self._banner)
+
+        self._stats['platform'] = platform
+
+        for i, command in enumerate(SSH.PAGER_COMMANDS[platform]):
+
+            self.write(command)
+
+            result = self.read()
+
+            # only the first lines can hold the error, since stanzas such as banners legitimately contain `^` and `%` lines
+        head = '\n'.join([line for line in result.splitlines() if line.strip()][:2])
+
+        if re.search(self._refusedRegex, head, re.MULTILINE | re.UNICODE):
+
+                self._log.warn('remote refused `{}`'.format(command))
+
+                # only the first command controls pagination; the rest merely widen the terminal
+                if i == 0: return False
+
+        self._log.info('disabled {} pagination'.format(platform))
+
+        self._stats['pagerDisabled'] = True
+
+        return True
+
+    def showRunningConfig(self, lazy=False):
+        """
+        :type lazy: bool
         :rtype: Configuration
         """
         self.write('show running-config')
 
         result = self.read()
 
-        return Configuration(result)
+        return Configuration(result, lazy=lazy)
+
+    def queryRunningConfig(self, selector, lazy=False):
+        """
+        Retrieves only the top-level stanzas of the running config that match `selector` (one regex, or a list of
+        them, with the same semantics as `Configuration.findChildren`). Where the platform supports it, the selector is
+        pushed down as `show running-config | section`; otherwise the full config is retrieved and filtered locally.
+        Either way, matching stanzas are returned once each, in config order.
+
+        :type selector: str|list[str]
+        :type lazy: bool
+        :rtype: Configuration
+        """
+        selectors = [selector] if isinstance(selector, _stringTypes) else list(selector)
+
+        platform = self._stats['platform'] or detectPlatform(self._banner)
+        filters = [self._deviceFilter(regex) for regex in selectors] if platform in SSH.SECTION_PLATFORMS else [None]
+
+        if None in filters:
+
+            self._log.debug('could not push selector down to the device; retrieving the full running-config')
+
+            return self.showRunningConfig(lazy=lazy).subset(*selectors)
+
+        # a single alternation, so that overlapping selectors cannot return a stanza twice or out of config order
+        self.write('show running-config | section {}'.format('|'.join(filters)))
+
+        result = self.read()
+
+        if re.search(self._refusedRegex, result, re.MULTILINE | re.UNICODE):
+
+            self._log.warn('remote refused `| section` filter; retrieving the full running-config')
+
+            return self.showRunningConfig(lazy=lazy).subset(*selectors)
+
+        # the device filter may match more loosely than the selector (e.g. anywhere in a child line), so filter again
+        return Configuration(result, lazy=lazy).subset(*selectors)
 
-    def showStartupConfig(self):
+    def _deviceFilter(self, regex):
         """
+        Translates a Python regex into the Cisco CLI regex dialect, or returns None if it uses anything beyond it
+
+        :type regex: str
+        :rtype: str|None
+        """
+        # `_` is a delimiter rather than a literal underscore in the Cisco dialect, so it cannot be translated
+        if '_' in regex or '(?' in regex or not re.match(r'^(?:[A-Za-z0-9 .\-/:*+?^$\[\]|()]|\\[ds])+$', regex):
+
+            return None
+
+        # findChild-style selectors ignore case, but the device's regex does not, so spell out both cases of each letter
+        caseless = ''
+        characterClass = None
+        i = 0
+
+        while i < len(regex):
+
+            c = regex[i]
+            i += 1
+
+            if c == '\\':
+
+                c = regex[i]
+                i += 1
+
+                if characterClass is not None: characterClass += '0-9' if c == 'd' else ' '
+                else: caseless += '[0-9]' if c == 'd' else ' '
+
+            elif characterClass is not None:
+
+                if c == ']' and characterClass.lstrip('^'):
+
+                    body = characterClass.lstrip('^')
+                    swapped = body.swapcase() if any(ch.isalpha() for ch in body) else ''
+
+                    caseless += '[' + characterClass + swapped + ']'
+                    characterClass = None
+
+                else:
+
+                    characterClass += c
+
+            elif c == '[':
+
+                characterClass = ''
+
+            elif c.isalpha():
+
+                caseless += '[' + c.upper() + c.lower() + ']'
+
+            else:
+
+                caseless += c
+
+        if characterClass is not None:
+
+            return None
+
+        # findChild-style selectors only match at the start of a line
+        result = caseless if caseless.startswith('^') else '^' + caseless
+
+        # the emitted subset means the same in Python, so check that the filter matches everything the selector does;
+        # a filter that matched less would silently drop stanzas
+        try:
+
+            compiled = re.compile(result)
+            examples = _examples(regex)
+
+        except (re.error, ValueError):
+
+            return None
+
+        for example in examples:
+
+            for variant in (example, example.upper(), example.lower()):
+
+                if compiled.match(variant) is None:
+
+                    self._log.debug('device filter {} is stricter than selector {}'.format(result, regex))
+                    return None
+
+        return result
+
+    def showStartupConfig(self, lazy=False):
+        """
+        :type lazy: bool
         :rtype: Configuration
         """
         self.write('show startup-config')
 
         result = self.read()
 
-        return Configuration(result)
+        return Configuration(result, lazy=lazy)
 
     def onRead(self, func):
 
@@ -508,7 +951,12 @@ class SSH(object):
 
         self._assertConnectionState(connected=True)
 
-        self._pty.write(bytearray(value, encoding='utf-8'))
+        self._transport.write(bytearray(value, encoding='utf-8'), mask=mask)
+
+        if self._dispatcher is not None:
+
+            self._dispatcher.write(value, mask=mask)
+            return
 
         for fn in self._writeHandler:
             fn(' {}'.format(re.sub(r'[^\r\n]', '*', value) if mask else value))
@@ -521,10 +969,11 @@ class SSH(object):
 
         self._assertConnectionState(connected=True)
 
-        canRead = self._pty.fd in select([self._pty.fd], [], [], 0.1)[0]
-        if not canRead: return None
+        result = self._transport.read(nr, timeout=0.1)
+
+        if result is not None and self._dispatcher is not None:
 
-        result = os.read(self._pty.fd, nr)
+            self._dispatcher.read(result)
 
         return result
 
@@ -551,7 +1000,7 @@ class SSH(object):
 
         if connected:
 
-            if not self._pty or not self._pty.isalive():
+            if not self._transport or not self._transport.isalive():
 
                 raise NotConnectedError('no SSH connection is established')
 
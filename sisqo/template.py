@@ -0,0 +1,556 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright © 2017 Alex Forster. All rights reserved.
+# This software is licensed under the 3-Clause ("New") BSD license.
+# See the LICENSE file for details.
+#
+
+
+import re
+import threading
+
+try:
+
+    _stringTypes = basestring
+
+except NameError:  # Python 3
+
+    _stringTypes = str
+
+
+class TemplateError(Exception): pass
+
+
+class Value(object):
+
+    OPTIONS = ('Filldown', 'Fillup', 'Required', 'List', 'Key')
+
+    def __init__(self, name, regex, options=None):
+        """
+        :type name: str
+        :type regex: str
+        :type options: list[str]|None
+        """
+        self.name = name
+        """:type: str"""
+        self.regex = regex
+        """:type: str"""
+        self.options = frozenset(options or [])
+        """:type: frozenset[str]"""
+
+        for option in self.options:
+
+            if option not in Value.OPTIONS:
+
+                raise TemplateError('unknown option "{}" on value "{}"'.format(option, name))
+
+        if not regex.startswith('(') or not regex.endswith(')'):
+
+            raise TemplateError('regex of value "{}" must be enclosed in parentheses'.format(name))
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<Value {} {}>'.format(self.name, self.regex)
+
+
+class Rule(object):
+
+    def __init__(self, regex, lineOp='Next', recordOp='NoRecord', newState=None, error=None):
+        """
+        :type regex: str
+        :type lineOp: str
+        :type recordOp: str
+        :type newState: str|None
+        :type error: str|None
+        """
+        self.regex = regex
+        """:type: str"""
+        self.lineOp = lineOp
+        """:type: str"""
+        self.recordOp = recordOp
+        """:type: str"""
+        self.newState = newState
+        """:type: str|None"""
+        self.error = error
+        """:type: str|None"""
+
+        self.match = None
+        """:type: (str) => re.Match|None"""
+        self.fields = []
+        """:type: list[(int, int)]"""
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<Rule "{}">'.format(self.regex)
+
+
+class Table(object):
+    """
+    Column-oriented parse results; `columns` maps each value name to the list of that value across all records
+    """
+
+    def __init__(self, header):
+        """
+        :type header: list[str]
+        """
+        self.header = list(header)
+        """:type: list[str]"""
+        self.columns = dict((name, []) for name in header)
+        """:type: dict[str, list]"""
+
+    def __len__(self):
+        """
+        :rtype: int
+        """
+        return len(self.columns[self.header[0]]) if self.header else 0
+
+    def __iter__(self):
+
+        return iter(self.rows())
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<Table columns={} rows={}>'.format(len(self.header), len(self))
+
+    def rows(self):
+        """
+        :rtype: list[list]
+        """
+        return [list(row) for row in zip(*[self.columns[name] for name in self.header])]
+
+    def toArrays(self):
+        """
+        Requires NumPy; `List` values become object arrays
+
+        :rtype: dict[str, numpy.ndarray]
+        """
+        import numpy
+
+        result = {}
+
+        for name in self.header:
+
+            column = self.columns[name]
+
+            if any(isinstance(value, list) for value in column):
+
+                array = numpy.empty(len(column), dtype=object)
+                array[:] = column
+
+            else:
+
+                array = numpy.array(column, dtype=str if column else object)
+
+            result[name] = array
+
+        return result
+
+
+class Template(object):
+    """
+    A TextFSM-style template compiled into a state machine of precompiled rules
+    """
+
+    _valueRegex = re.compile(r'^Value\s+(?:(?P<options>[A-Za-z]+(?:,[A-Za-z]+)*)\s+)?(?P<name>\w+)\s+(?P<regex>\(.*\))\s*$')
+    _ruleRegex = re.compile(r'^\s+(?P<regex>\^.*?)(?:\s+->\s+(?P<action>.*?))?\s*$')
+    _actionRegex = re.compile(r'^(?:(?P<lineOp>Next|Continue)(?:\.(?P<recordOp1>NoRecord|Record|Clearall|Clear))?|'
+                              r'(?P<recordOp2>NoRecord|Record|Clearall|Clear))?'
+                              r'(?:(?:^|\s+)(?P<newState>\w+))?$')
+    _errorRegex = re.compile(r'^Error(?:\s+"(?P<message>[^"]*)")?$')
+
+    def __init__(self, text):
+        """
+        :type text: str
+        """
+        self.values = []
+        """:type: list[Value]"""
+        self.states = {}
+        """:type: dict[str, list[Rule]]"""
+
+        self._parse(text)
+        self._compile()
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<Template values={} states={}>'.format(len(self.values), len(self.states))
+
+    @property
+    def header(self):
+        """
+        :rtype: list[str]
+        """
+        return [value.name for value in self.values]
+
+    def _parse(self, text):
+        """
+        :type text: str
+        """
+        lines = re.split(r'\r?\n', text, flags=re.UNICODE)
+        state = None
+
+        for lineNumber, line in enumerate(lines, start=1):
+
+            if line.lstrip().startswith('#'):
+
+                continue
+
+            if len(line.strip()) == 0:
+
+                state = None
+                continue
+
+            if line.startswith('Value ') and not self.states:
+
+                match = self._valueRegex.match(line)
+
+                if match is None:
+
+                    raise TemplateError('line {}: malformed value definition'.format(lineNumber))
+
+                options = match.group('options')
+
+                self.values.append(Value(name=match.group('name'), regex=match.group('regex'),
+                                         options=options.split(',') if options else None))
+
+                continue
+
+            if not line[0].isspace():
+
+                state = line.strip()
+
+                if not re.match(r'^\w+$', state) or state in self.states:
+
+                    raise TemplateError('line {}: invalid or duplicate state "{}"'.format(lineNumber, state))
+
+                self.states[state] = []
+                continue
+
+            if state is None:
+
+                raise TemplateError('line {}: rule outside of a state'.format(lineNumber))
+
+            self.states[state].append(self._parseRule(line, lineNumber))
+
+        if 'Start' not in self.states:
+
+            raise TemplateError('template has no Start state')
+
+        if self.states.get('End') or self.states.get('EOF'):
+
+            raise TemplateError('End and EOF states may not have rules')
+
+    def _parseRule(self, line, lineNumber):
+        """
+        :type line: str
+        :type lineNumber: int
+        :rtype: Rule
+        """
+        match = self._ruleRegex.match(line)
+
+        if match is None:
+
+            raise TemplateError('line {}: malformed rule'.format(lineNumber))
+
+        regex, action = match.group('regex'), (match.group('action') or '').strip()
+
+        error = self._errorRegex.match(action)
+
+        if error is not None:
+
+            return Rule(regex, error=error.group('message') or 'state machine error')
+
+        action = self._actionRegex.match(action)
+
+        if action is None:
+
+            raise TemplateError('line {}: malformed action'.format(lineNumber))
+
+        rule = Rule(regex,
+                    lineOp=action.group('lineOp') or 'Next',
+                    recordOp=action.group('recordOp1') or action.group('recordOp2') or 'NoRecord',
+                    newState=action.group('newState'))
+
+        if rule.lineOp == 'Continue' and rule.newState is not None:
+
+            raise TemplateError('line {}: Continue may not change state'.format(lineNumber))
+
+        return rule
+
+    def _compile(self):
+
+        names = dict((value.name, value) for value in self.values)
+        index = dict((value.name, i) for i, value in enumerate(self.values))
+
+        def substitute(match):
+
+            if match.group(0) == '$$':
+
+                return '$'
+
+            name = match.group(1) or match.group(2)
+
+            if name not in names:
+
+                raise TemplateError('rule references undefined value "{}"'.format(name))
+
+            return '(?P<{}>{})'.format(name, names[name].regex)
+
+        for state, rules in self.states.items():
+
+            for rule in rules:
+
+                if rule.newState is not None and rule.newState not in self.states and rule.newState != 'End':
+
+                    raise TemplateError('rule "{}" transitions to undefined state "{}"'.format(rule.regex, rule.newState))
+
+                regex = re.sub(r'\$\$|\$\{(\w+)\}|\$(\w+)', substitute, rule.regex)
+
+                try:
+
+                    compiled = re.compile(regex, flags=re.UNICODE)
+
+                except re.error as ex:
+
+                    raise TemplateError('rule "{}" does not compile: {}'.format(rule.regex, ex))
+
+                # resolve each captured value to its group number up front, so parsing never touches group names
+                rule.match = compiled.match
+                rule.fields = sorted((group, index[name]) for name, group in compiled.groupindex.items() if name in index)
+
+    def parse(self, output):
+        """
+        :type output: str|collections.Iterable[str]
+        :rtype: Table
+        """
+        if isinstance(output, _stringTypes):
+
+            output = output.splitlines()
+
+        table = Table(self.header)
+        columns = [table.columns[value.name] for value in self.values]
+        appenders = [column.append for column in columns]
+
+        isList = [('List' in value.options) for value in self.values]
+        lists = [i for i, value in enumerate(self.values) if isList[i]]
+        filldown = [i for i, value in enumerate(self.values) if 'Filldown' in value.options]
+        fillup = [i for i, value in enumerate(self.values) if 'Fillup' in value.options]
+        required = [i for i, value in enumerate(self.values) if 'Required' in value.options]
+
+        # flatten each rule into a tuple, which is markedly cheaper to unpack per line than attribute lookups; a rule
+        # whose groups are exactly the values, in order, is flagged so that a whole row can be taken from it at once
+        everyValue = [(n + 1, n) for n in range(len(self.values))]
+        states = dict((state, []) for state in self.states)
+
+        for state, rules in self.states.items():
+
+            for rule in rules:
+
+                newState = None if rule.newState == 'End' else states[rule.newState or state]
+                states[state].append((rule.match, rule.fields, rule.error, rule.recordOp, rule.lineOp == 'Next', newState,
+                                      rule.fields == everyValue))
+
+        if not (lists or filldown or fillup):
+
+            self._parseSimple(output, states['Start'], columns, required)
+            return table
+
+        def empty(i):
+
+            return [] if isList[i] else ''
+
+        current = [empty(i) for i in range(len(self.values))]
+
+        def record():
+
+            if not any(current) or (required and not all(current[i] for i in required)):
+
+                return
+
+            for append, value in zip(appenders, current):
+
+                append(value)
+
+            for i in fillup:
+
+                if not current[i]: continue
+
+                # Fillup copies a value backwards into earlier records until one already has it
+                for row in range(len(columns[i]) - 2, -1, -1):
+
+                    if columns[i][row]: break
+                    columns[i][row] = current[i]
+
+        blank = [''] * len(self.values)
+
+        def clear(all):
+
+            if not lists and (all or not filldown):
+
+                current[:] = blank
+                return
+
+            kept = [] if all else [(i, current[i]) for i in filldown]
+
+            current[:] = blank
+
+            for i in lists:
+
+                current[i] = []
+
+            for i, value in kept:
+
+                current[i] = list(value) if isList[i] else value
+
+        rules = states['Start']
+
+        for line in output:
+
+            for match, fields, error, recordOp, nextLine, newState, _ in rules:
+
+                match = match(line)
+
+                if match is None: continue
+
+                groups = match.groups()
+
+                for n, i in fields:
+
+                    value = groups[n - 1]
+
+                    if value is None: continue
+
+                    if isList[i]: current[i].append(value)
+                    else: current[i] = value
+
+                if error is not None:
+
+                    raise TemplateError('{} (on line "{}")'.format(error, line))
+
+                if recordOp == 'NoRecord':
+
+                    pass
+
+                elif recordOp == 'Record':
+
+                    record()
+                    clear(all=False)
+
+                elif recordOp == 'Clear':
+
+                    clear(all=False)
+
+                elif recordOp == 'Clearall':
+
+                    clear(all=True)
+
+                if nextLine:
+
+                    rules = newState
+                    break
+
+            if rules is None:  # the End state
+
+                break
+
+        if rules is not None and 'EOF' not in self.states:
+
+            record()
+
+        return table
+
+    def _parseSimple(self, output, rules, columns, required):
+        """
+        `parse()` for templates without Filldown, Fillup or List values, where a record never carries anything over to
+        the next one; rows are collected whole and transposed into `columns` at the end, which avoids most of the
+        per-record bookkeeping
+
+        :type output: collections.Iterable[str]
+        :type rules: list[tuple]
+        :type columns: list[list]
+        :type required: list[int]
+        """
+        width = len(self.values)
+        rows = []
+        current = [''] * width
+
+        for line in output:
+
+            for match, fields, error, recordOp, nextLine, newState, wholeRow in rules:
+
+                match = match(line)
+
+                if match is None: continue
+
+                groups = match.groups()
+
+                if wholeRow and len(groups) == width and None not in groups:
+
+                    current = list(groups)
+
+                else:
+
+                    for n, i in fields:
+
+                        value = groups[n - 1]
+
+                        if value is not None: current[i] = value
+
+                if error is not None:
+
+                    raise TemplateError('{} (on line "{}")'.format(error, line))
+
+                if recordOp == 'Record':
+
+                    if any(current) and (not required or all(current[i] for i in required)): rows.append(current)
+                    current = [''] * width
+
+                elif recordOp != 'NoRecord':  # without Filldown values, Clear and Clearall are the same
+
+                    current = [''] * width
+
+                if nextLine:
+
+                    rules = newState
+                    break
+
+            if rules is None:  # the End state
+
+                break
+
+        if rules is not None and 'EOF' not in self.states:
+
+            if any(current) and all(current[i] for i in required): rows.append(current)
+
+        for column, values in zip(columns, zip(*rows)):
+
+            column.extend(values)
+
+
+_cache = {}
+_cacheLock = threading.Lock()
+
+
+def compileTemplate(text):
+    """
+    Returns a compiled `Template`, reusing a previous compilation of the same template text
+
+    :type text: str
+    :rtype: Template
+    """
+    with _cacheLock:
+
+        template = _cache.get(text)
+
+        if template is None:
+
+            template = _cache[text] = Template(text)
+
+        return template
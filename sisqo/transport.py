@@ -0,0 +1,290 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright © 2017 Alex Forster. All rights reserved.
+# This software is licensed under the 3-Clause ("New") BSD license.
+# See the LICENSE file for details.
+#
+
+
+import os
+import errno
+import socket
+import threading
+
+from select import select
+
+from ptyprocess import PtyProcess
+
+
+class Transport(object):
+    """
+    A bidirectional byte stream between an `SSH` session and a remote command line
+    """
+
+    def write(self, data, mask=False):
+        """
+        `mask` marks secrets such as passwords, which must never be logged or recorded
+
+        :type data: bytes|bytearray
+        :type mask: bool
+        """
+        raise NotImplementedError()
+
+    def read(self, nr=1024, timeout=0.1):
+        """
+        Returns up to `nr` bytes, or None if nothing arrived within `timeout` seconds; raises EOFError once the remote
+        end has closed the stream
+
+        :type nr: int
+        :type timeout: float
+        :rtype: bytes|None
+        """
+        raise NotImplementedError()
+
+    def isalive(self):
+        """
+        :rtype: bool
+        """
+        raise NotImplementedError()
+
+    def close(self):
+
+        raise NotImplementedError()
+
+
+class PtyTransport(Transport):
+    """
+    Runs the OpenSSH client in a pseudo terminal
+    """
+
+    def __init__(self, host, port=22, username=None, timeout=10, sshOptions=None, dimensions=(24, 80)):
+        """
+        :type host: str
+        :type port: int
+        :type username: str|None
+        :type timeout: int|None
+        :type sshOptions: list|None
+        :type dimensions: (int, int)
+        """
+
+        args = ['ssh']
+        args.extend(sshOptions or [])
+        args.extend(['-oConnectTimeout={}'.format(timeout)] if isinstance(timeout, int) else [])
+        args.extend(['-p', str(port)] if isinstance(port, int) and port != 22 else [])
+        args.extend([(username + '@' if username else '') + host])
+
+        self._args = args
+        """:type: list[str]"""
+        self._pty = PtyProcess.spawn(args, dimensions=dimensions, env={'TERM': 'vt100'})
+        """:type: ptyprocess.PtyProcess"""
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<PtyTransport `{}`>'.format(' '.join(self._args))
+
+    def write(self, data, mask=False):
+        """
+        :type data: bytes|bytearray
+        :type mask: bool
+        """
+        self._pty.write(data)
+
+    def read(self, nr=1024, timeout=0.1):
+        """
+        :type nr: int
+        :type timeout: float
+        :rtype: bytes|None
+        """
+        canRead = self._pty.fd in select([self._pty.fd], [], [], timeout)[0]
+        if not canRead: return None
+
+        try:
+
+            result = os.read(self._pty.fd, nr)
+
+        except OSError as ex:
+
+            # Linux reports a closed pty as EIO rather than as an empty read
+            if ex.errno == errno.EIO: raise EOFError('pty closed')
+            raise
+
+        if not result: raise EOFError('pty closed')
+
+        return result
+
+    def isalive(self):
+        """
+        :rtype: bool
+        """
+        return self._pty.isalive()
+
+    def close(self):
+
+        self._pty.terminate(force=True)
+
+
+class SocketTransport(Transport):
+    """
+    Carries the byte stream over a plain TCP socket within this process, e.g. to a terminal server's raw TCP port;
+    there is no SSH and no telnet option negotiation, so it cannot talk to an SSH or telnet server
+    """
+
+    def __init__(self, host, port, timeout=10):
+        """
+        :type host: str
+        :type port: int
+        :type timeout: int|None
+        """
+
+        self._address = (host, port)
+        """:type: (str, int)"""
+        self._socket = socket.create_connection(self._address, timeout=timeout)
+        """:type: socket.socket"""
+        self._socket.settimeout(None)
+        self._eof = False
+        """:type: bool"""
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<SocketTransport {}:{}>'.format(*self._address)
+
+    def write(self, data, mask=False):
+        """
+        :type data: bytes|bytearray
+        :type mask: bool
+        """
+        self._socket.sendall(data)
+
+    def read(self, nr=1024, timeout=0.1):
+        """
+        :type nr: int
+        :type timeout: float
+        :rtype: bytes|None
+        """
+        canRead = self._socket in select([self._socket], [], [], timeout)[0]
+        if not canRead: return None
+
+        result = self._socket.recv(nr)
+
+        if not result:
+
+            self._eof = True
+            raise EOFError('socket closed')
+
+        return result
+
+    def isalive(self):
+        """
+        :rtype: bool
+        """
+        return self._socket is not None and not self._eof
+
+    def close(self):
+
+        if self._socket is not None:
+
+            self._socket.close()
+            self._socket = None
+
+
+class LoopbackTransport(Transport):
+    """
+    An in-memory transport for tests and benchmarks; bytes passed to `feed()` are read back by the session, and
+    everything the session writes is recorded in `written` and optionally answered by `responder`
+    """
+
+    def __init__(self, responder=None):
+        """
+        :type responder: ((bytes) => bytes|None)|None
+        """
+
+        self._responder = responder
+        """:type: ((bytes) => bytes|None)|None"""
+        self._buffer = bytearray()
+        """:type: bytearray"""
+        self._ready = threading.Condition()
+        """:type: threading.Condition"""
+        self._hungUp = False
+        """:type: bool"""
+        self._closed = False
+        """:type: bool"""
+
+        self.written = bytearray()
+        """:type: bytearray"""
+
+    def __repr__(self):
+        """
+        :rtype: str
+        """
+        return '<LoopbackTransport>'
+
+    def feed(self, data):
+        """
+        :type data: bytes|bytearray|str
+        """
+        if not isinstance(data, (bytes, bytearray)):
+
+            data = bytearray(data, encoding='utf-8')
+
+        with self._ready:
+
+            self._buffer.extend(data)
+            self._ready.notify_all()
+
+    def hangup(self):
+        """
+        Signals EOF to the session once any pending bytes have been read
+        """
+        with self._ready:
+
+            self._hungUp = True
+            self._ready.notify_all()
+
+    def write(self, data, mask=False):
+        """
+        :type data: bytes|bytearray
+        :type mask: bool
+        """
+        self.written.extend(data)
+
+        if self._responder is not None:
+
+            response = self._responder(bytes(data))
+
+            if response: self.feed(response)
+
+    def read(self, nr=1024, timeout=0.1):
+        """
+        :type nr: int
+        :type timeout: float
+        :rtype: bytes|None
+        """
+        with self._ready:
+
+            if not self._buffer and not self._hungUp:
+
+                self._ready.wait(timeout)
+
+            if not self._buffer:
+
+                if self._hungUp: raise EOFError('loopback hung up')
+                return None
+
+            result = bytes(self._buffer[:nr])
+            del self._buffer[:nr]
+
+            return result
+
+    def isalive(self):
+        """
+        :rtype: bool
+        """
+        return not self._closed
+
+    def close(self):
+
+        self._closed = True